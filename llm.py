@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import json
+
+import llm_scheduler
+import resilience
+from llm_scheduler import INTERACTIVE, BATCH
+from single_flight import SingleFlight
+
+# Entry point for every Gemini call in the project.
+# Identical prompts that are in flight at the same time (same model, same
+# normalized contents and options) share one upstream request, and that
+# request is admitted by the quota-aware scheduler.
+
+flights = SingleFlight()
+scheduler = llm_scheduler.from_env()
+# No hedging: a duplicate prompt costs quota. Rate limits are the scheduler's
+# business, and running out of the caller's budget is the caller's; neither
+# should trip the breaker for everyone else.
+gemini = resilience.upstream(
+    "gemini", max_timeout=60.0, hedge=False,
+    trips_on=lambda e: not (llm_scheduler.is_rate_limited(e)
+                            or isinstance(e, (resilience.DeadlineExceeded, resilience.CircuitOpen))),
+)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def prompt_key(model, contents, **kwargs) -> tuple:
+    name = getattr(model, "model_name", str(model))
+    payload = json.dumps([_normalize(contents), kwargs], sort_keys=True, default=repr, ensure_ascii=False)
+    return name, hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def generate_content(model, contents, priority=INTERACTIVE, wait_timeout=None, **kwargs):
+    """model.generate_content(contents, **kwargs), coalesced with identical in-flight calls.
+
+    priority is llm.INTERACTIVE for chat a user is waiting on, llm.BATCH for
+    planning jobs and prefetching. The current request budget (see resilience)
+    bounds the time spent queued in the scheduler and waiting on a coalesced
+    call, as well as the call itself; wait_timeout can narrow the latter.
+    """
+    key = prompt_key(model, contents, **kwargs)
+    tokens = llm_scheduler.estimate_tokens(contents)
+
+    def send(timeout):
+        return model.generate_content(contents, request_options={"timeout": timeout}, **kwargs)
+
+    # The flight carries the leader's queue ticket, so an interactive caller that
+    # joins a batch leader's call pulls it forward instead of waiting at batch priority.
+    ticket = scheduler.ticket(priority)
+
+    def lead():
+        return scheduler.run(lambda: gemini.call(send), priority, tokens, timeout=resilience.remaining(), ticket=ticket)
+    return flights.do(key, lead, resilience.remaining(wait_timeout), state=ticket,
+                      on_join=lambda leader: scheduler.promote(leader, priority), retry_on=_leader_only)
+
+
+def _leader_only(error) -> bool:
+    # The shared call runs under the leader's budget. If that budget ran out, or
+    # the leader's rerun was interrupted, followers with time left start over.
+    return isinstance(error, resilience.DeadlineExceeded) or not isinstance(error, Exception)
+
+
+async def generate_content_async(model, contents, **kwargs):
+    # Runs on a worker thread; cancelling this coroutine abandons the wait but
+    # leaves the shared call running for the other callers.
+    return await asyncio.to_thread(generate_content, model, contents, **kwargs)
+
+
+def stats() -> dict:
+    return {"single_flight": flights.stats(), "scheduler": scheduler.stats()}
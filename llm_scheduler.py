@@ -0,0 +1,382 @@
+import heapq
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+
+import resilience
+
+# Central scheduler for Gemini calls.
+# Interactive chat and batch planning share one API key, so every call is
+# admitted against requests-per-minute and tokens-per-minute buckets, with
+# interactive work always ahead of batch in the queue and batch capped to a
+# share of the concurrency. Rate-limit errors back off with full jitter and
+# halve the concurrency limit; otherwise the limit follows observed latency.
+# The buckets live in a SQLite file by default, so the Streamlit app and the
+# batch scripts (separate processes on the same key) draw from one quota.
+
+INTERACTIVE = 0
+BATCH = 1
+CLASS_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+def is_rate_limited(error: Exception) -> bool:
+    # google.api_core.exceptions.ResourceExhausted carries code 429.
+    return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted" or "429" in str(error)
+
+
+def estimate_tokens(contents, output_tokens=512) -> int:
+    # ~4 characters per token is close enough for admission control.
+    return len(str(contents)) // 4 + output_tokens
+
+# --- Token bucket ---
+class TokenBucket:
+    def __init__(self, per_minute: float, burst=0.1, clock=time.monotonic):
+        # Provider quotas are sliding 60 s windows, so a full minute of burst on
+        # top of the refill rate could admit nearly 2x the quota. Keep it small.
+        self.capacity = max(1.0, per_minute * burst)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        # Correct an estimate once the real usage is known (may go negative).
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+# --- Quota ---
+class LocalQuota:
+    """RPM and TPM buckets for this process only."""
+
+    def __init__(self, rpm: float, tpm: float, burst=0.1):
+        self.requests = TokenBucket(rpm, burst)
+        self.tokens = TokenBucket(tpm, burst)
+
+    def acquire(self, tokens: float, headroom=0) -> float:
+        """Take one request and tokens and return 0, or return the seconds to wait.
+
+        headroom extra requests must be available without being taken.
+        """
+        wait = max(self.requests.delay(1 + headroom), self.tokens.delay(tokens))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        return 0.0
+
+    def adjust_tokens(self, amount: float):
+        self.tokens.adjust(amount)
+
+
+class SharedQuota:
+    """RPM and TPM buckets kept in a SQLite file, shared by every process that opens it.
+
+    Refill, check and debit happen in one write transaction, so two processes
+    cannot both spend the last request. Times are wall-clock for the same reason.
+    """
+
+    def __init__(self, path: str, rpm: float, tpm: float, burst=0.1):
+        self.path = path
+        self._limits = {"requests": (max(1.0, rpm * burst), rpm / 60.0),
+                        "tokens": (max(1.0, tpm * burst), tpm / 60.0)}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        now = time.time()
+        for name, (capacity, _) in self._limits.items():
+            self._db.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", (name, capacity, now))
+
+    def _update(self, change):
+        # change(levels) returns the new levels, or None to leave them alone.
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                levels = {}
+                for name, tokens, updated in self._db.execute("SELECT name, tokens, updated FROM buckets"):
+                    if name in self._limits:
+                        capacity, rate = self._limits[name]
+                        levels[name] = min(capacity, tokens + max(0.0, now - updated) * rate)
+                result, new = change(levels)
+                if new is not None:
+                    self._db.executemany("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?",
+                                         [(v, now, k) for k, v in new.items()])
+                self._db.execute("COMMIT")
+                return result
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def acquire(self, tokens: float, headroom=0) -> float:
+        def change(levels):
+            wanted = {"requests": 1 + headroom, "tokens": tokens}
+            wait = 0.0
+            for name, amount in wanted.items():
+                capacity, rate = self._limits[name]
+                amount = min(amount, capacity)
+                if levels[name] < amount:
+                    wait = max(wait, (amount - levels[name]) / rate)
+            if wait > 0:
+                return wait, None
+            return 0.0, {"requests": levels["requests"] - 1,
+                         "tokens": levels["tokens"] - min(tokens, self._limits["tokens"][0])}
+        return self._update(change)
+
+    def adjust_tokens(self, amount: float):
+        def change(levels):
+            return None, {"tokens": min(self._limits["tokens"][0], levels["tokens"] - amount)}
+        self._update(change)
+
+
+def default_quota_path() -> str:
+    return os.getenv("HJ_LLM_QUOTA_DB", os.path.join(tempfile.gettempdir(), "hj-travel-llm-quota.sqlite"))
+
+# --- Scheduler ---
+class LLMScheduler:
+    def __init__(self, rpm=60, tpm=250_000, max_concurrency=8, min_concurrency=1, burst=0.1,
+                 batch_share=0.5, interactive_reserve=1, max_retries=5, backoff_base=1.0, backoff_cap=30.0,
+                 quota=None):
+        # quota is a SharedQuota to coordinate with other processes; by default
+        # the buckets are local to this scheduler.
+        self.quota = quota or LocalQuota(rpm, tpm, burst)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.batch_share = batch_share
+        self.interactive_reserve = interactive_reserve
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.limit = float(max_concurrency)
+        self._active = {INTERACTIVE: 0, BATCH: 0}
+        self._queue = []
+        self._seq = itertools.count()
+        self._pause_until = 0.0
+        self._cond = threading.Condition()
+
+        self._recent = deque(maxlen=20)    # latency samples: last few calls
+        self._history = deque(maxlen=500)  # and the longer run they are judged against
+        self.counts = {"completed": 0, "failed": 0, "rate_limited": 0, "retries": 0, "expired": 0, "promoted": 0,
+                       "interactive": 0, "batch": 0}
+
+    def ticket(self, priority=INTERACTIVE) -> list:
+        """A place in the queue for one run(); pass it to promote() to raise its priority later."""
+        return [priority, None]
+
+    def promote(self, ticket, priority):
+        """Raise a queued (or about to be retried) call to priority, e.g. when a user starts waiting on it."""
+        with self._cond:
+            if priority >= ticket[0]:
+                return
+            ticket[0] = priority
+            self.counts["promoted"] += 1
+            if any(t is ticket for t in self._queue):
+                heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def run(self, fn, priority=INTERACTIVE, tokens=1000, timeout=None, ticket=None):
+        """Call fn() once admitted, retrying with jittered backoff on rate-limit errors.
+
+        If the call is not admitted within timeout seconds (across retries),
+        resilience.DeadlineExceeded is raised. ticket (from self.ticket()) lets
+        another thread promote the call while it waits.
+        """
+        ticket = ticket or self.ticket(priority)
+        self._count(CLASS_NAMES[ticket[0]])
+        expires = None if timeout is None else time.monotonic() + timeout
+        for attempt in range(self.max_retries + 1):
+            cls = self._acquire(ticket, tokens, expires)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                limited = is_rate_limited(e)
+                self._release(cls, None, rate_limited=limited, attempt=attempt)
+                if not limited or attempt == self.max_retries:
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                continue
+            except BaseException:
+                self._release(cls, None)
+                raise
+            self._release(cls, time.monotonic() - start, used_tokens=_used_tokens(result), estimated=tokens)
+            self._count("completed")
+            return result
+
+    def _count(self, name):
+        with self._cond:
+            self.counts[name] += 1
+
+    def _slots(self, priority) -> bool:
+        limit = max(self.min_concurrency, int(self.limit))
+        if sum(self._active.values()) >= limit:
+            return False
+        if priority == BATCH:
+            return self._active[BATCH] < max(1, int(limit * self.batch_share))
+        return True
+
+    def _admit_delay(self, ticket, tokens):
+        # None means "wait for a notify", a number means "wait that long and re-check".
+        if self._queue[0] is not ticket or not self._slots(ticket[0]):
+            return None
+        pause = self._pause_until - time.monotonic()
+        if pause > 0:
+            return pause
+        # Batch only runs while the request bucket would still have room for a chat.
+        # A zero from the quota means the request and tokens have been taken.
+        headroom = 0 if ticket[0] == INTERACTIVE else self.interactive_reserve
+        return self.quota.acquire(tokens, headroom)
+
+    def _acquire(self, ticket, tokens, expires=None):
+        """Wait until ticket is admitted and return the class it was admitted as."""
+        with self._cond:
+            ticket[1] = next(self._seq)
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait = self._admit_delay(ticket, tokens)
+                    if wait == 0:
+                        break
+                    if expires is not None:
+                        left = expires - time.monotonic()
+                        if left <= 0:
+                            self.counts["expired"] += 1
+                            raise resilience.DeadlineExceeded("request budget ran out while queued for the LLM")
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(wait)
+            except BaseException:
+                self._queue = [t for t in self._queue if t is not ticket]
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._active[ticket[0]] += 1
+            self._cond.notify_all()
+            return ticket[0]
+
+    def _release(self, priority, latency, rate_limited=False, attempt=0, used_tokens=None, estimated=0):
+        with self._cond:
+            self._active[priority] -= 1
+            if rate_limited:
+                self.counts["rate_limited"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                self._pause_until = max(self._pause_until, time.monotonic() + delay)
+            elif latency is not None:
+                self._observe(latency)
+            if used_tokens is not None:
+                self.quota.adjust_tokens(used_tokens - estimated)
+            self._cond.notify_all()
+
+    def _observe(self, latency):
+        # Latency-gradient control: grow by ~1 per window while the median of the
+        # last few calls stays near the long-run median, shrink by 10% once it
+        # passes twice that. Medians, not the fastest call seen, because LLM
+        # latency varies with answer length even on an idle backend.
+        self._recent.append(latency)
+        self._history.append(latency)
+        if len(self._recent) < self._recent.maxlen or len(self._history) < 2 * self._recent.maxlen:
+            return
+        if _median(self._recent) > 2 * _median(self._history):
+            self.limit = max(self.min_concurrency, self.limit * 0.9)
+            self._recent.clear()  # judge the new limit on fresh samples
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self.counts, limit=round(self.limit, 2), queued=len(self._queue),
+                        active=sum(self._active.values()),
+                        latency_p50_s=round(_median(self._history), 3) if self._history else None)
+
+
+def _median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def _used_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+
+def from_env() -> LLMScheduler:
+    # HJ_LLM_QUOTA_DB="" keeps the quota in-process (e.g. for a single test run).
+    rpm = float(os.getenv("HJ_LLM_RPM", "60"))
+    tpm = float(os.getenv("HJ_LLM_TPM", "250000"))
+    path = default_quota_path()
+    quota = None
+    if path:
+        try:
+            quota = SharedQuota(path, rpm, tpm)
+        except sqlite3.Error:
+            quota = None    # unwritable location: fall back to a per-process quota
+    return LLMScheduler(rpm=rpm, tpm=tpm, max_concurrency=int(os.getenv("HJ_LLM_CONCURRENCY", "8")), quota=quota)
+
+# --- Demo against the quota-enforcing fake backend ---
+def _demo(seconds=30.0, batch_jobs=15, chat_every=3.0, max_latency=None):
+    # max_latency=1.8 draws each call's latency from 0.3-1.8 s; the limit
+    # should stay near max_concurrency because the backend is not overloaded.
+    from concurrent.futures import ThreadPoolExecutor
+    from standins import FakeQuotaModel
+
+    backend = FakeQuotaModel(rpm=30, tpm=20_000, latency=0.3, max_latency=max_latency)
+    # Schedule at 90% of the quota so the burst allowance stays inside the window.
+    scheduler = LLMScheduler(rpm=27, tpm=18_000, max_concurrency=6, backoff_base=0.5)
+    interactive_ms = []
+
+    def chat(i):
+        start = time.monotonic()
+        scheduler.run(lambda: backend.generate_content(f"chat {i}"), INTERACTIVE, 300)
+        interactive_ms.append((time.monotonic() - start) * 1000)
+
+    def batch(i):
+        scheduler.run(lambda: backend.generate_content(f"plan {i}"), BATCH, 300)
+
+    deadline = time.monotonic() + seconds
+    with ThreadPoolExecutor(max_workers=40) as pool:
+        futures = [pool.submit(batch, i) for i in range(batch_jobs)]
+        i = 0
+        while time.monotonic() < deadline:
+            futures.append(pool.submit(chat, i))
+            i += 1
+            time.sleep(chat_every)
+        for f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                print("failed:", e)
+
+    interactive_ms.sort()
+    print("scheduler:", scheduler.stats())
+    print("backend:  ", backend.stats())
+    if interactive_ms:
+        print(f"interactive p50 {interactive_ms[len(interactive_ms) // 2]:.0f} ms, "
+              f"max {interactive_ms[-1]:.0f} ms over {len(interactive_ms)} chats")
+
+
+if __name__ == "__main__":
+    _demo()
+    _demo(max_latency=1.8)
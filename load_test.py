@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+import standins
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Load harness for v6_streamlit_agent.py.
+# Starts one real `streamlit run`-equivalent server (in a child process, with
+# every external service replaced by a local stand-in) and drives it over the
+# same websocket protocol the browser uses. --concurrency sessions are driven
+# at once; finished sessions stay connected until the end of the run, so the
+# server holds every session's state while CPU and RSS are sampled from its PID.
+#
+#   python load_test.py --sessions 50 --concurrency 10 --llm-latency 1.5
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "v6_streamlit_agent.py")
+
+QUESTIONS = [
+    "Plan 5 days in Dubai",
+    "What to do in Karachi?",
+    "Best time to visit Tokyo?",
+    "Cheap food in Paris",
+]
+DESTINATIONS = ["Paris", "Tokyo", "London", "Dubai", "Karachi", "Miami"]
+
+# --- Server ---
+def serve(port: int, latency: standins.Latency):
+    """Run the app on port with the stand-ins installed (blocks; used in the child process)."""
+    from streamlit.web import bootstrap
+
+    options = {"server_port": port, "server_headless": True, "browser_gatherUsageStats": False,
+               "server_fileWatcherType": "none"}
+    with standins.installed(latency):
+        bootstrap.load_config_options(options)
+        bootstrap.run(APP, False, [], options)
+
+
+def start_server(port: int, args, timeout=60.0) -> subprocess.Popen:
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)]
+    for name in ("geocode", "weather", "flights", "ip", "llm"):
+        cmd += [f"--{name}-latency", str(getattr(args, f"{name}_latency"))]
+    cmd += ["--jitter", str(args.jitter)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as res:
+                if res.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not become healthy")
+
+# --- Server process metrics ---
+def cpu_seconds(pid: int) -> float:
+    if psutil:
+        t = psutil.Process(pid).cpu_times()
+        return t.user + t.system
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_bytes(pid: int) -> int:
+    if psutil:
+        return psutil.Process(pid).memory_info().rss
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class Sampler:
+    """Samples the server's RSS in the background and keeps the peak."""
+
+    def __init__(self, pid: int, every=0.25):
+        self.pid = pid
+        self.every = every
+        self.peak = rss_bytes(pid)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.every):
+            try:
+                self.peak = max(self.peak, rss_bytes(self.pid))
+            except OSError:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+# --- Sessions ---
+class Session:
+    """One browser tab: a websocket to /_stcore/stream and the widget values it has set."""
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.ws = None
+        self.widgets = {}   # widget id -> WidgetState to send with every rerun
+        self.ids = {}       # (element type, position among that type) -> widget id
+
+    async def __aenter__(self):
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    async def rerun(self, trigger=None) -> float:
+        """Send a rerun (optionally with a one-shot chat message) and wait for the script to finish."""
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        for state in self.widgets.values():
+            msg.rerun_script.widget_states.widgets.append(state)
+        if trigger is not None:
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = self.ids[("chat_input", 0)]
+            state.chat_input_value.data = trigger
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        seen = {}
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout))
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                etype = element.WhichOneof("type")
+                if etype == "exception":
+                    raise RuntimeError(element.exception.message)
+                widget_id = getattr(getattr(element, etype), "id", "")
+                if widget_id:
+                    n = seen.get(etype, 0)
+                    seen[etype] = n + 1
+                    self.ids[(etype, n)] = widget_id
+            elif kind == "script_finished" and fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - start
+
+    def set_text(self, position: int, value: str):
+        """Type value into the position-th text_input; it is sent with every later rerun."""
+        widget_id = self.ids[("text_input", position)]
+        self.widgets[widget_id] = WidgetState(id=widget_id, string_value=value)
+
+
+async def drive(session: Session, index: int, turns: int) -> list:
+    latencies = [await session.rerun()]
+    session.set_text(0, DESTINATIONS[index % len(DESTINATIONS)])   # sidebar "Enter City"
+    latencies.append(await session.rerun())
+    for turn in range(turns):
+        latencies.append(await session.rerun(QUESTIONS[(index + turn) % len(QUESTIONS)]))
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+async def run_sessions(url, sessions, concurrency, turns, timeout) -> tuple:
+    gate = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+    results = []
+
+    async def one(index):
+        await gate.acquire()
+        released = False
+        try:
+            async with Session(url, timeout) as session:
+                results.append((await drive(session, index, turns), None))
+                # Hand the slot to the next session but stay connected (so the
+                # server keeps holding this session) until everyone has finished.
+                gate.release()
+                released = True
+                await done.wait()
+        except Exception as e:
+            results.append(([], f"session {index}: {e!r}"))
+        finally:
+            if not released:
+                gate.release()
+
+    tasks = [asyncio.create_task(one(i)) for i in range(sessions)]
+    while len(results) < sessions:
+        await asyncio.sleep(0.05)
+    wall_end = time.perf_counter()
+    done.set()
+    await asyncio.gather(*tasks)
+    return results, wall_end
+
+
+def run(sessions: int, concurrency: int, turns: int, args, port=8765) -> dict:
+    server = start_server(port, args)
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    try:
+        # One session first so imports, caches and the semantic cache start-up
+        # are not counted against the measured sessions.
+        asyncio.run(run_sessions(url, 1, 1, 1, args.timeout))
+        time.sleep(1.0)
+        rss0, cpu0 = rss_bytes(server.pid), cpu_seconds(server.pid)
+        with Sampler(server.pid) as sampler:
+            wall0 = time.perf_counter()
+            results, wall_end = asyncio.run(run_sessions(url, sessions, concurrency, turns, args.timeout))
+            cpu = cpu_seconds(server.pid) - cpu0
+            rss_live = rss_bytes(server.pid)
+        wall = wall_end - wall0
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    latencies = [x for lat, _ in results for x in lat]
+    errors = [e for _, e in results if e]
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "reruns": len(latencies),
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "reruns_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_rerun_ms": round(statistics.median(latencies) * 1000, 1) if latencies else 0.0,
+        "p95_rerun_ms": round(percentile(latencies, 95) * 1000, 1),
+        "server_cpu_util": round(cpu / wall, 3) if wall else 0.0,
+        "server_cpu_ms_per_rerun": round(cpu * 1000 / len(latencies), 2) if latencies else 0.0,
+        "server_rss_mb_baseline": round(rss0 / 2**20, 1),
+        "server_rss_mb_peak": round(sampler.peak / 2**20, 1),
+        # All sessions are still connected when this is read.
+        "server_rss_kb_per_live_session": round((rss_live - rss0) / 1024 / sessions, 1) if sessions else 0.0,
+        "first_errors": errors[:3],
+    }
+
+# --- CLI ---
+def main():
+    p = argparse.ArgumentParser(description="Drive a v6_streamlit_agent.py server with many simulated sessions.")
+    p.add_argument("--sessions", type=int, default=20)
+    p.add_argument("--concurrency", type=int, default=5, help="sessions driven at the same time")
+    p.add_argument("--turns", type=int, default=3, help="chat messages per session")
+    p.add_argument("--timeout", type=float, default=60.0, help="per-rerun timeout in seconds")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--geocode-latency", type=float, default=0.05)
+    p.add_argument("--weather-latency", type=float, default=0.15)
+    p.add_argument("--flights-latency", type=float, default=0.2)
+    p.add_argument("--ip-latency", type=float, default=0.05)
+    p.add_argument("--llm-latency", type=float, default=1.0)
+    p.add_argument("--jitter", type=float, default=0.2)
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    p.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.serve:
+        serve(args.port, standins.Latency(geocode=args.geocode_latency, weather=args.weather_latency,
+                                          flights=args.flights_latency, ip=args.ip_latency,
+                                          llm=args.llm_latency, jitter=args.jitter))
+        return
+
+    report = run(args.sessions, args.concurrency, args.turns, args, args.port)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print("=" * 50)
+    for k, v in report.items():
+        print(f"{k:>30}: {v}")
+
+
+if __name__ == "__main__":
+    main()
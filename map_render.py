@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+from travel_cache import TTLCache, USER
+
+# Lightweight map rendering for the Streamlit view.
+# folium inlines a full HTML document (bootstrap, jquery, awesome-markers and a
+# random-id script) on every render. Here the page only links Leaflet from the
+# CDN, so the browser caches the shared JS/CSS, and the per-map part is a few
+# hundred bytes of JSON. Output is cached per (lat, lon, zoom, markers) and is
+# byte-for-byte stable, so Streamlit sees an unchanged element on reruns and
+# does not reload the iframe.
+
+LEAFLET_CSS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"
+LEAFLET_JS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"
+
+TEMPLATE = """<!DOCTYPE html><html><head><meta charset="utf-8">
+<link rel="stylesheet" href="%(css)s"/><script src="%(js)s"></script>
+<style>html,body,#map{height:100%%;margin:0}</style></head>
+<body><div id="map"></div><script>
+var d=%(data)s,m=L.map('map').setView([d.lat,d.lon],d.zoom);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',{attribution:'&copy; OpenStreetMap contributors'}).addTo(m);
+d.markers.forEach(function(k){var e=document.createElement('span');e.textContent=k[2];L.marker([k[0],k[1]]).addTo(m).bindPopup(e);});
+</script></body></html>"""
+
+cache = TTLCache(ttl=7 * 24 * 3600, maxsize=256)
+
+# --- Metrics ---
+_stats = {"renders": 0, "render_ms": 0.0, "calls": 0, "bytes": 0}
+_stats_lock = threading.Lock()
+
+
+def _key(lat, lon, zoom, markers):
+    return (round(lat, 5), round(lon, 5), zoom,
+            tuple((round(a, 5), round(b, 5), str(label)) for a, b, label in markers))
+
+
+def _render(key) -> str:
+    start = time.perf_counter()
+    lat, lon, zoom, markers = key
+    data = json.dumps({"lat": lat, "lon": lon, "zoom": zoom, "markers": markers}, ensure_ascii=False)
+    html = TEMPLATE % {"css": LEAFLET_CSS, "js": LEAFLET_JS, "data": data.replace("</", "<\\/")}
+    with _stats_lock:
+        _stats["renders"] += 1
+        _stats["render_ms"] += (time.perf_counter() - start) * 1000
+    return html
+
+
+def render(lat: float, lon: float, zoom: int = 10, markers=(), source=USER) -> str:
+    """Return the map HTML for the given view. markers is an iterable of (lat, lon, popup_text)."""
+    key = _key(lat, lon, zoom, markers)
+    if source != USER:
+        return cache.refresh(key, lambda: _render(key))
+    html = cache.get_or_load(key, lambda: _render(key))
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["bytes"] += len(html.encode("utf-8"))
+    return html
+
+
+def stats() -> dict:
+    with _stats_lock:
+        s = dict(_stats)
+    s["avg_bytes"] = round(s["bytes"] / s["calls"]) if s["calls"] else 0
+    s["avg_render_ms"] = round(s["render_ms"] / s["renders"], 3) if s["renders"] else 0.0
+    return s
+
+# --- Benchmark ---
+def _benchmark(reruns=50):
+    import folium
+
+    lat, lon, label = 48.8566, 2.3522, "Paris"
+    start = time.perf_counter()
+    for _ in range(reruns):
+        m = folium.Map(location=[lat, lon], zoom_start=10)
+        folium.Marker([lat, lon], popup=label).add_to(m)
+        old = m._repr_html_()
+    old_ms = (time.perf_counter() - start) * 1000 / reruns
+
+    start = time.perf_counter()
+    for _ in range(reruns):
+        new = render(lat, lon, 10, [(lat, lon, label)])
+    new_ms = (time.perf_counter() - start) * 1000 / reruns
+
+    print(f"folium:      {len(old.encode('utf-8')):>7} bytes  {old_ms:8.3f} ms/rerun")
+    print(f"map_render:  {len(new.encode('utf-8')):>7} bytes  {new_ms:8.3f} ms/rerun")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import travel_cache
+import travel_services
+from travel_cache import PREFETCH
+
+# Background warm-up for the destinations most users ask about.
+# A daemon thread refreshes geocoding, weather, the map and (optionally) a
+# starter plan for the top-N cities in the request log, at a limited rate and
+# only while no live user request is waiting on an upstream call.
+
+# Same set as get_weather_forecast in v2/v3; seeds the ranking before the log has data.
+POPULAR = ["Miami", "Tokyo", "Paris", "London", "New York", "Los Angeles", "Chicago"]
+
+# --- Request log ---
+_counts = Counter()
+_log_lock = threading.Lock()
+
+
+def request_log_path() -> str:
+    # Read on every use so a load test can point it at a scratch file.
+    return os.getenv("HJ_REQUEST_LOG", "request_log.jsonl")
+
+
+def record_request(destination: str):
+    destination = destination.strip()
+    if not destination:
+        return
+    with _log_lock:
+        _counts[destination.title()] += 1
+        try:
+            with open(request_log_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ts": time.time(), "destination": destination}) + "\n")
+        except OSError:
+            pass
+
+
+def load_request_log(path=None, max_lines=100_000) -> Counter:
+    path = path or request_log_path()
+    counts = Counter()
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()[-max_lines:]
+    except OSError:
+        return counts
+    for line in lines:
+        try:
+            counts[json.loads(line)["destination"].strip().title()] += 1
+        except (ValueError, KeyError, AttributeError):
+            continue
+    return counts
+
+
+def top_destinations(n: int) -> list:
+    with _log_lock:
+        counts = _counts.copy()
+    ranked = [city for city, _ in counts.most_common(n)]
+    for city in POPULAR:
+        if len(ranked) >= n:
+            break
+        if city not in ranked:
+            ranked.append(city)
+    return ranked
+
+# --- Prefetcher ---
+class Prefetcher:
+    def __init__(self, top_n=30, interval=15 * 60, min_gap=2.0, include_plans=False):
+        self.top_n = top_n
+        self.interval = interval        # seconds between refresh rounds
+        self.min_gap = min_gap          # seconds between upstream calls (rate limit)
+        self.include_plans = include_plans
+        self.rounds = 0
+        self.failures = 0
+        self._last_call = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            # Reload what would expire before the next round (with slack for the
+            # round itself); anything fresher is left alone.
+            travel_cache.REFRESH_MARGIN = max(travel_cache.REFRESH_MARGIN, 1.5 * self.interval)
+            with _log_lock:
+                _counts.update(load_request_log())
+            self._thread = threading.Thread(target=self._loop, name="prefetcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def _throttle(self):
+        # Keep at least min_gap between calls and step aside while users are waiting.
+        while not self._stop.is_set():
+            wait = self._last_call + self.min_gap - time.monotonic()
+            if wait <= 0 and travel_services.live_inflight() == 0:
+                break
+            self._stop.wait(max(wait, 0.1))
+        self._last_call = time.monotonic()
+
+    def _refresh(self, fn, *args):
+        self._throttle()
+        if self._stop.is_set():
+            return None
+        try:
+            return fn(*args, source=PREFETCH)
+        except Exception:
+            self.failures += 1
+            return None
+
+    def run_once(self):
+        for city in top_destinations(self.top_n):
+            if self._stop.is_set():
+                return
+            coords = self._refresh(travel_services.geocode, city)
+            if coords:
+                self._refresh(travel_services.map_html, coords[0], coords[1], city)
+            self._refresh(travel_services.current_weather, city)
+            if self.include_plans:
+                self._refresh(travel_services.plan, city)
+        self.rounds += 1
+
+    def metrics(self) -> dict:
+        caches = travel_services.cache_stats()
+        return {
+            "rounds": self.rounds,
+            "refreshed": sum(c["refreshes"] for c in caches.values()),
+            "failures": self.failures,
+            # A map renders locally in microseconds, so a prefetched one saves
+            # no upstream round trip; it is reported apart from the real savings.
+            "cold_paths_saved": sum(c["prefetch_saves"] for name, c in caches.items() if name != "map"),
+            "map_renders_saved": caches.get("map", {}).get("prefetch_saves", 0),
+            "caches": caches,
+        }
+
+
+def from_env() -> Prefetcher:
+    return Prefetcher(
+        top_n=int(os.getenv("HJ_PREFETCH_TOP_N", "30")),
+        interval=float(os.getenv("HJ_PREFETCH_INTERVAL", str(15 * 60))),
+        min_gap=float(os.getenv("HJ_PREFETCH_MIN_GAP", "2.0")),
+        include_plans=os.getenv("HJ_PREFETCH_PLANS", "0") == "1",
+    )
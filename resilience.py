@@ -0,0 +1,286 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# Deadlines, hedging and circuit breaking for outbound calls.
+# A page render sets an overall budget; every external call gets a timeout
+# from what is left of it (capped per upstream). If the first attempt is still
+# running past the upstream's observed p95, a duplicate is sent and the first
+# answer wins. Upstreams that keep failing trip a breaker, and while it is open
+# callers get the last good value for the same key instead of waiting.
+
+REQUEST_BUDGET = float(os.getenv("HJ_REQUEST_BUDGET", "30"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's request budget ran out."""
+
+
+class UpstreamTimeout(TimeoutError):
+    """The upstream did not answer within its own per-call cap."""
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+# --- Deadlines ---
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def set_budget(seconds: float = REQUEST_BUDGET):
+    """Start a new overall budget for the current request (e.g. one Streamlit rerun)."""
+    _deadline.set(time.monotonic() + seconds)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Narrow the current budget to at most seconds for the enclosed calls."""
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _is_timeout(error: Exception) -> bool:
+    # requests, urllib3, geopy and google.api_core each have their own timeout types.
+    name = type(error).__name__
+    return isinstance(error, TimeoutError) or "Timeout" in name or "TimedOut" in name or "DeadlineExceeded" in name
+
+
+def remaining(cap=None):
+    """Seconds left in the current budget, at most cap; None if neither limits it."""
+    d = _deadline.get()
+    if d is None:
+        return cap
+    left = d - time.monotonic()
+    return left if cap is None else min(cap, left)
+
+# --- Latency tracking ---
+class LatencyTracker:
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct: float):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {f"p{p}_ms": round(v * 1000, 1) if v is not None else None
+                for p, v in ((p, self.percentile(p)) for p in (50, 95, 99))}
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        # Half-open lets calls through; the first result closes or re-opens it.
+        return self.state != "open"
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+# --- Upstream ---
+class Upstream:
+    """One external dependency: its timeout cap, hedging policy, breaker and last good values."""
+
+    def __init__(self, name, max_timeout, hedge=True, min_samples=20, max_hedge_ratio=0.1,
+                 failure_threshold=5, reset_after=30.0, trips_on=None, stale_size=256, pool_size=64):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.hedge = hedge
+        # Hedged attempts run on a pool of this upstream's own, so time spent
+        # queued behind another upstream's stalls is never blamed on this one.
+        # Attempts that lose a hedge keep their thread until they time out, so
+        # the pool needs room for those on top of the live calls.
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"upstream-{name}") if hedge else None
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.trips_on = trips_on or (lambda error: True)
+        self.breaker = CircuitBreaker(failure_threshold, reset_after)
+        self.primary = LatencyTracker()   # first attempts only: the latency without hedging
+        self.served = LatencyTracker()    # what callers actually waited
+        self._stale = OrderedDict()
+        self._stale_size = stale_size
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failures": 0,
+                       "stale_served": 0, "short_circuited": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def call(self, fn, key=None):
+        """Return fn(timeout) within the current deadline.
+
+        fn must be safe to run twice (it may be hedged). On failure, or while
+        the breaker is open, the last good result for key is returned if there
+        is one; otherwise the error is raised.
+        """
+        start = time.monotonic()
+        self._count("calls")
+        try:
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise CircuitOpen(f"{self.name}: circuit open")
+            timeout = remaining(self.max_timeout)
+            if timeout <= 0:
+                raise DeadlineExceeded(f"{self.name}: no time left in the request budget")
+            try:
+                result = self._hedged(fn, timeout)
+            except Exception as e:
+                # A timeout only says something about the upstream if it had the
+                # full per-upstream cap; a short caller budget is the caller's problem.
+                if self.trips_on(e) and not (_is_timeout(e) and timeout < self.max_timeout):
+                    self.breaker.failure()
+                raise
+            self.breaker.success()
+            if key is not None:
+                with self._lock:
+                    self._stale[key] = result
+                    self._stale.move_to_end(key)
+                    while len(self._stale) > self._stale_size:
+                        self._stale.popitem(last=False)
+            return result
+        except Exception:
+            self._count("failures")
+            with self._lock:
+                found = key is not None and key in self._stale
+                value = self._stale.get(key) if found else None
+            if not found:
+                raise
+            self._count("stale_served")
+            return value
+        finally:
+            self.served.add(time.monotonic() - start)
+
+    def _hedge_delay(self):
+        if not self.hedge or len(self.primary) < self.min_samples:
+            return None
+        return self.primary.percentile(95)
+
+    def _reserve_hedge(self) -> bool:
+        # Check and count under one lock so concurrent callers cannot overshoot the ratio.
+        with self._lock:
+            if self.counts["hedged"] >= self.max_hedge_ratio * self.counts["calls"]:
+                return False
+            self.counts["hedged"] += 1
+            return True
+
+    def _attempt(self, fn, timeout, primary):
+        start = time.monotonic()
+        try:
+            return fn(timeout)
+        finally:
+            if primary:
+                self.primary.add(time.monotonic() - start)
+
+    def _hedged(self, fn, timeout):
+        if self._pool is None:
+            # Nothing to race against: call on the caller's thread and rely on fn's own timeout.
+            return self._attempt(fn, timeout, True)
+        expires = time.monotonic() + timeout
+        first = self._pool.submit(self._attempt, fn, timeout, True)
+        pending = {first}
+        hedge_after = self._hedge_delay()
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done and self._reserve_hedge():
+                pending.add(self._pool.submit(self._attempt, fn, expires - time.monotonic(), False))
+
+        error = None
+        while pending:
+            left = expires - time.monotonic()
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is not first:
+                        self._count("hedge_wins")
+                    return f.result()
+                error = f.exception()
+        if error is not None:
+            raise error
+        if timeout < self.max_timeout:
+            raise DeadlineExceeded(f"{self.name}: request budget ran out after {timeout:.2f}s")
+        raise UpstreamTimeout(f"{self.name}: no answer within {timeout:.2f}s")
+
+    def report(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(counts, breaker=self.breaker.state,
+                    before=self.primary.summary(), after=self.served.summary())
+
+
+UPSTREAMS = {}
+
+
+def upstream(name, max_timeout, **kwargs) -> Upstream:
+    if name not in UPSTREAMS:
+        UPSTREAMS[name] = Upstream(name, max_timeout, **kwargs)
+    return UPSTREAMS[name]
+
+
+def report() -> dict:
+    """Tail latency per upstream: 'before' is first attempts alone, 'after' is what callers saw."""
+    return {name: u.report() for name, u in UPSTREAMS.items()}
+
+# --- Demo against the stalling stand-in server ---
+def _demo(calls=400, workers=8):
+    import requests
+    from standins import StallServer
+
+    with StallServer(latency=0.02, stall=2.0, stall_rate=0.03) as server:
+        plain = Upstream("no-hedge", max_timeout=5.0, hedge=False)
+        hedged = Upstream("hedged", max_timeout=5.0)
+
+        def fetch(t):
+            return requests.get(server.url, timeout=t).json()
+
+        for u in (plain, hedged):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda _: u.call(fetch), range(calls)))
+            r = u.report()
+            print(f"{u.name:>9}: first attempts {r['before']}")
+            print(f"{'':>9}  served         {r['after']}  hedged {r['hedged']}, hedge wins {r['hedge_wins']}")
+
+
+if __name__ == "__main__":
+    _demo()
@@ -0,0 +1,547 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# Semantic answer cache for the travel chat.
+# Questions are embedded on CPU and looked up in an on-disk vector index (one
+# per scope, such as the selected language). A stored answer is returned when
+# the nearest question is above the similarity threshold and mentions the same
+# numbers ("5 days" must not answer "3 days").
+#
+# Answers live in SQLite next to the index files. Small scopes use an exact
+# flat index; once a scope passes IVF_THRESHOLD entries a background thread
+# trains a faiss IVF index on it and swaps it in, replaying the adds and
+# removals that happened meanwhile. Both index types delete in place, so
+# eviction never forces a rebuild. Without faiss a brute-force numpy matrix
+# is used: correct, but it will not hit single-digit milliseconds at a million
+# entries.
+
+EMBED_MODEL = os.getenv("HJ_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+THRESHOLD = float(os.getenv("HJ_SEMANTIC_THRESHOLD", "0.9"))
+MAX_ENTRIES = int(os.getenv("HJ_SEMANTIC_MAX_ENTRIES", "1000000"))
+TTL = float(os.getenv("HJ_SEMANTIC_TTL", str(7 * 24 * 3600)))
+IVF_THRESHOLD = int(os.getenv("HJ_SEMANTIC_IVF_THRESHOLD", "20000"))
+NPROBE = 16
+
+_NUMBERS = re.compile(r"\d+")
+
+# --- Embedding ---
+class HashingEmbedder:
+    """Fallback when sentence-transformers is not installed: hashed word and
+    character-trigram features. Catches rewordings of the same words, not true paraphrases."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _features(self, text):
+        words = re.findall(r"\w+", text.casefold())
+        yield from words
+        for w in words:
+            padded = f"#{w}#"
+            yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def encode(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return _normalize(out)
+
+
+class SentenceEmbedder:
+    def __init__(self, name=EMBED_MODEL):
+        self.model = SentenceTransformer(name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        return _normalize(np.asarray(self.model.encode(texts, convert_to_numpy=True), dtype="float32"))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def default_embedder():
+    return SentenceEmbedder() if SentenceTransformer is not None else HashingEmbedder()
+
+# --- Vector index ---
+class _FlatIndex:
+    """numpy stand-in for faiss when it is not installed."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype="float32")
+        self.ids = np.zeros(0, dtype="int64")
+
+    @property
+    def ntotal(self):
+        return len(self.ids)
+
+    def add_with_ids(self, vectors, ids):
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.ids = np.concatenate([self.ids, ids])
+
+    def remove_ids(self, ids):
+        keep = ~np.isin(self.ids, ids)
+        self.vectors, self.ids = self.vectors[keep], self.ids[keep]
+
+    def search(self, query, k):
+        if not self.ntotal:
+            return np.full((1, k), -1.0, dtype="float32"), np.full((1, k), -1, dtype="int64")
+        scores = self.vectors @ query[0]
+        top = np.argsort(-scores)[:k]
+        pad = k - len(top)
+        return (np.pad(scores[top], (0, pad), constant_values=-1.0)[None, :],
+                np.pad(self.ids[top], (0, pad), constant_values=-1)[None, :])
+
+
+def _build_index(dim, ids, vectors):
+    """Exact search below IVF_THRESHOLD entries, an IVF index trained on vectors above it."""
+    if faiss is None:
+        index = _FlatIndex(dim)
+    elif len(ids) < IVF_THRESHOLD:
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    else:
+        # ~sqrt(n) lists keeps the probed fraction small; k-means does not need
+        # more than a few dozen points per list to place the centroids.
+        nlist = int(min(1024, max(64, len(ids) ** 0.5)))
+        sample = np.random.default_rng(0).choice(len(ids), min(len(ids), 64 * nlist), replace=False)
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors[np.sort(sample)])
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)  # makes remove_ids O(ids), not O(n)
+        index.nprobe = NPROBE
+    if len(ids):
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def _is_ivf(index):
+    return faiss is not None and isinstance(index, faiss.IndexIVF)
+
+
+def _remove_ids(index, ids):
+    ids = np.asarray(ids, dtype="int64")
+    if faiss is None:
+        index.remove_ids(ids)
+    else:
+        index.remove_ids(faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids)))
+
+
+def _read_vectors(db, scope, dim, after=0):
+    # Fill preallocated arrays: a million 384-d rows are 1.5 GB, too much to hold twice.
+    n = db.execute("SELECT COUNT(*) FROM answers WHERE scope=? AND id>?", (scope, after)).fetchone()[0]
+    ids = np.empty(n, dtype="int64")
+    vectors = np.empty((n, dim), dtype="float32")
+    cur = db.execute("SELECT id, vector FROM answers WHERE scope=? AND id>? ORDER BY id", (scope, after))
+    i = 0
+    for rows in iter(lambda: cur.fetchmany(10_000), []):
+        for row_id, blob in rows[:n - i]:
+            ids[i] = row_id
+            vectors[i] = np.frombuffer(blob, dtype="float32")
+            i += 1
+    return ids[:i], vectors[:i]
+
+
+def _index_path(directory, scope):
+    return os.path.join(directory, "index-" + hashlib.sha1(scope.encode("utf-8")).hexdigest()[:16])
+
+
+def _save_index(index, path, meta):
+    # Write then rename, so a crash mid-save leaves the previous files intact.
+    if faiss is None:
+        with open(path + ".npz.tmp", "wb") as f:
+            np.savez(f, vectors=index.vectors, ids=index.ids)
+        os.replace(path + ".npz.tmp", path + ".npz")
+    else:
+        faiss.write_index(index, path + ".faiss.tmp")
+        os.replace(path + ".faiss.tmp", path + ".faiss")
+    with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".json.tmp", path + ".json")
+
+
+def _load_index(path, dim):
+    """Return (index, meta) as last saved, or (None, None)."""
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if faiss is None:
+            data = np.load(path + ".npz")
+            index = _FlatIndex(dim)
+            index.add_with_ids(data["vectors"], data["ids"])
+        else:
+            index = faiss.read_index(path + ".faiss")
+    except (OSError, ValueError, RuntimeError):
+        return None, None
+    return index, meta
+
+# --- Cache ---
+class SemanticCache:
+    def __init__(self, directory=None, embedder=None, threshold=THRESHOLD, max_entries=MAX_ENTRIES,
+                 ttl=TTL, k=8, rebuild_ratio=0.2, save_interval=300.0, sweep_interval=60.0, sweep_batch=1000):
+        directory = directory or os.getenv("HJ_SEMANTIC_DIR", ".semantic_cache")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.embedder = embedder or default_embedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.k = k
+        self.rebuild_ratio = rebuild_ratio
+        self.save_interval = save_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()   # saves never overlap each other or a rebuild
+        self._db_path = os.path.join(directory, "answers.sqlite3")
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+        # WAL lets the rebuild thread read a consistent snapshot while requests write.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT, question TEXT, answer TEXT, vector BLOB,
+                created REAL, last_hit REAL, hits INTEGER DEFAULT 0);
+            CREATE INDEX IF NOT EXISTS answers_last_hit ON answers (last_hit);
+            CREATE INDEX IF NOT EXISTS answers_created ON answers (created);
+            CREATE INDEX IF NOT EXISTS answers_question ON answers (scope, question);
+        """)
+        self._indexes = {}
+        self._counts = {}      # scope -> live entries, kept in step with SQLite
+        self._built = {}       # scope -> entries the IVF index was trained on (0 for flat)
+        self._replay = {}      # scope -> changes made while its index is being rebuilt
+        self._saving = {}      # scope -> changes held back while its index is being written
+        self._pending = []     # scopes waiting for a rebuild
+        self._wake = threading.Event()
+        self._closed = False
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._last_sweep = 0.0
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.rebuilds = 0
+        self.rebuild_failures = 0
+        self.lookup_ms = 0.0
+
+        with self._lock:
+            for (scope,) in self._db.execute("SELECT DISTINCT scope FROM answers").fetchall():
+                self._open(scope)
+        self._worker = threading.Thread(target=self._maintain, name="semantic-cache-index", daemon=True)
+        self._worker.start()
+
+    # --- Index bookkeeping ---
+    def _open(self, scope):
+        # Start from the saved index and add the rows written after it was saved.
+        dim = self.embedder.dim
+        index, meta = _load_index(_index_path(self.directory, scope), dim)
+        if index is None:
+            index, meta = _build_index(dim, *_read_vectors(self._db, scope, dim)), {"max_id": 0, "built": 0}
+        else:
+            ids, vectors = _read_vectors(self._db, scope, dim, after=meta["max_id"])
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+        self._indexes[scope] = index
+        self._built[scope] = meta["built"] if _is_ivf(index) else 0
+        self._counts[scope] = self._db.execute("SELECT COUNT(*) FROM answers WHERE scope=?", (scope,)).fetchone()[0]
+        # Rows deleted after the last save are still in the index; results skip
+        # them, but rebuild once they are a sizeable share of it.
+        if index.ntotal - self._counts[scope] > self.rebuild_ratio * max(1, index.ntotal):
+            self._schedule(scope)
+        self._check_size(scope)
+
+    def _index(self, scope):
+        if scope not in self._indexes:
+            self._indexes[scope] = _build_index(self.embedder.dim, np.zeros(0, dtype="int64"),
+                                                np.zeros((0, self.embedder.dim), dtype="float32"))
+            self._counts[scope] = 0
+            self._built[scope] = 0
+        return self._indexes[scope]
+
+    def _check_size(self, scope):
+        # Move to IVF past the threshold, and retrain once a scope has grown 4x
+        # past what its lists were sized for.
+        if faiss is None:
+            return
+        live, built = self._counts[scope], self._built[scope]
+        if (not built and live >= IVF_THRESHOLD) or (built and live > 4 * built):
+            self._schedule(scope)
+
+    def _schedule(self, scope):
+        if scope not in self._pending and scope not in self._replay:
+            self._pending.append(scope)
+            self._wake.set()
+
+    def _maintain(self):
+        while not self._closed:
+            self._wake.wait(self.save_interval)
+            self._wake.clear()
+            while self._pending and not self._closed:
+                with self._lock:
+                    scope = self._pending.pop(0)
+                # A save in progress would apply its held-back changes to the
+                # swapped-in index, which already has them from the replay log.
+                with self._save_lock:
+                    self._rebuild(scope)
+            if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+                self.save()
+
+    def _rebuild(self, scope):
+        """Build a fresh index for scope off the lock and swap it in."""
+        db = sqlite3.connect(self._db_path, isolation_level=None)
+        try:
+            with self._lock:
+                # The first read pins the snapshot; later changes go to the replay log.
+                db.execute("BEGIN")
+                db.execute("SELECT COUNT(*) FROM answers WHERE scope=?", (scope,)).fetchone()
+                self._replay[scope] = []
+            ids, vectors = _read_vectors(db, scope, self.embedder.dim)
+            db.execute("COMMIT")
+            index = _build_index(self.embedder.dim, ids, vectors)
+            del vectors
+            with self._lock:
+                for op_ids, op_vectors in self._replay.pop(scope):
+                    if op_vectors is None:
+                        _remove_ids(index, op_ids)
+                    else:
+                        index.add_with_ids(op_vectors, op_ids)
+                self._indexes[scope] = index
+                self._built[scope] = len(ids) if _is_ivf(index) else 0
+                self.rebuilds += 1
+                self._dirty = True
+        except Exception:
+            with self._lock:
+                self._replay.pop(scope, None)
+                self.rebuild_failures += 1
+        finally:
+            db.close()
+
+    def _change(self, scope, ids, vectors=None):
+        """Add ids with vectors to scope's index, or remove them if vectors is None. Caller holds the lock."""
+        if scope in self._saving:
+            self._saving[scope].append((ids, vectors))
+        elif vectors is None:
+            _remove_ids(self._indexes[scope], ids)
+        else:
+            self._indexes[scope].add_with_ids(vectors, ids)
+        if scope in self._replay:
+            self._replay[scope].append((ids, vectors))
+
+    def _delete(self, rows):
+        """Remove (id, scope) rows from SQLite and their indexes. Caller holds the lock and commits."""
+        by_scope = {}
+        for row_id, scope in rows:
+            by_scope.setdefault(scope, []).append(row_id)
+        for scope, ids in by_scope.items():
+            ids = np.array(ids, dtype="int64")
+            if scope in self._indexes:
+                self._change(scope, ids)
+            self._counts[scope] = self._counts.get(scope, 0) - len(ids)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500].tolist()
+                self._db.execute(f"DELETE FROM answers WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+    # --- Public API ---
+    def lookup(self, question: str, scope: str = ""):
+        """Return the stored answer for the closest matching question, or None."""
+        start = time.perf_counter()
+        vector = self.embedder.encode([question])
+        with self._lock:
+            self.lookups += 1
+            index = self._indexes.get(scope)
+            answer = None
+            if index is not None:
+                scores, ids = index.search(vector, self.k)
+                candidates = [int(i) for s, i in zip(scores[0], ids[0]) if i >= 0 and s >= self.threshold]
+                if candidates:
+                    rows = {r[0]: r for r in self._db.execute(
+                        f"SELECT id, question, answer, created FROM answers WHERE id IN ({','.join('?' * len(candidates))})",
+                        candidates)}
+                    now = time.time()
+                    for i in candidates:
+                        row = rows.get(i)
+                        if row and now - row[3] <= self.ttl and _NUMBERS.findall(row[1]) == _NUMBERS.findall(question):
+                            self._db.execute("UPDATE answers SET hits=hits+1, last_hit=? WHERE id=?", (now, i))
+                            self._db.commit()
+                            self.hits += 1
+                            answer = row[2]
+                            break
+            self.lookup_ms += (time.perf_counter() - start) * 1000
+        return answer
+
+    def add(self, question: str, answer: str, scope: str = ""):
+        """Store answer for question, replacing an earlier answer to the same question."""
+        vector = self.embedder.encode([question])
+        with self._lock:
+            now = time.time()
+            self._index(scope)
+            self._delete(self._db.execute("SELECT id, scope FROM answers WHERE scope=? AND question=?",
+                                          (scope, question)).fetchall())
+            cur = self._db.execute(
+                "INSERT INTO answers (scope, question, answer, vector, created, last_hit) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, question, answer, vector[0].tobytes(), now, now))
+            self._change(scope, np.array([cur.lastrowid], dtype="int64"), vector)
+            self._counts[scope] += 1
+            self._evict(now)
+            self._db.commit()
+            self._dirty = True
+            self._check_size(scope)
+
+    def _evict(self, now):
+        # Expired rows are swept in bounded batches so no single add pays for a
+        # backlog; lookups already ignore anything past its TTL.
+        evicted = 0
+        if now - self._last_sweep >= self.sweep_interval:
+            expired = self._db.execute("SELECT id, scope FROM answers WHERE created < ? LIMIT ?",
+                                       (now - self.ttl, self.sweep_batch)).fetchall()
+            if len(expired) < self.sweep_batch:
+                self._last_sweep = now
+            self._delete(expired)
+            evicted += len(expired)
+        over = sum(self._counts.values()) - self.max_entries
+        if over > 0:
+            lru = self._db.execute("SELECT id, scope FROM answers ORDER BY last_hit LIMIT ?", (over,)).fetchall()
+            self._delete(lru)
+            evicted += len(lru)
+        self.evictions += evicted
+
+    def save(self):
+        """Write every index and the last row id it covers.
+
+        The lock is only held to start and finish each scope: while its index
+        is written (about a second at a million entries) lookups keep searching
+        it, and adds and removals are queued and applied afterwards.
+        """
+        with self._save_lock:
+            with self._lock:
+                self._dirty = False
+                self._last_save = time.monotonic()
+                scopes = list(self._indexes)
+            for scope in scopes:
+                with self._lock:
+                    max_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM answers").fetchone()[0]
+                    index = self._indexes[scope]
+                    meta = {"max_id": max_id, "built": self._built[scope]}
+                    self._saving[scope] = []
+                try:
+                    _save_index(index, _index_path(self.directory, scope), meta)
+                finally:
+                    with self._lock:
+                        for ids, vectors in self._saving.pop(scope):
+                            self._change(scope, ids, vectors)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._worker.join()
+        if self._dirty:
+            self.save()
+        self._db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": sum(self._counts.values()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "rebuilds": self.rebuilds,
+                "rebuilding": sorted(self._replay),
+                "avg_lookup_ms": round(self.lookup_ms / self.lookups, 3) if self.lookups else 0.0,
+                "backend": {scope: "faiss-ivf" if _is_ivf(index) else "faiss-flat" if faiss is not None else "numpy-flat"
+                            for scope, index in self._indexes.items()},
+            }
+
+# --- Shared instance ---
+# Loading the embedding model can take a minute (or hang on a network timeout
+# when the model hub is unreachable), so it happens once, on a background
+# thread, and a failure is final for the life of the process.
+_default = None
+_state = "idle"  # idle -> loading -> ready | unavailable
+_error = None
+_default_lock = threading.Lock()
+
+
+def start():
+    """Build the shared cache in the background; later calls are no-ops."""
+    global _state
+    with _default_lock:
+        if _state != "idle":
+            return
+        _state = "loading"
+    threading.Thread(target=_build, name="semantic-cache", daemon=True).start()
+
+
+def _build():
+    global _default, _state, _error
+    try:
+        cache = SemanticCache()
+    except Exception as e:
+        _error = repr(e)
+        _state = "unavailable"
+        return
+    _default = cache
+    _state = "ready"
+
+
+def get_default():
+    """The shared cache, or None while it is loading or if it failed to load."""
+    return _default
+
+
+def status() -> dict:
+    return {"state": _state, "error": _error}
+
+# --- Benchmark ---
+def _benchmark(entries=1_000_000, queries=200, removals=1000, dim=384):
+    # Index operations only; embedding cost is the model's and is reported separately.
+    rng = np.random.default_rng(0)
+    vectors = np.empty((entries, dim), dtype="float32")
+    for start in range(0, entries, 100_000):
+        n = min(100_000, entries - start)
+        vectors[start:start + n] = _normalize(rng.standard_normal((n, dim)).astype("float32"))
+    start = time.perf_counter()
+    index = _build_index(dim, np.arange(entries, dtype="int64"), vectors)
+    build_s = time.perf_counter() - start
+    del vectors
+    probes = _normalize(rng.standard_normal((queries, dim)).astype("float32"))
+    start = time.perf_counter()
+    for q in probes:
+        index.search(q[None, :], 8)
+    per_query = (time.perf_counter() - start) * 1000 / queries
+    start = time.perf_counter()
+    for i in rng.choice(entries, removals, replace=False):
+        _remove_ids(index, [i])
+    per_removal = (time.perf_counter() - start) * 1000 / removals
+    embedder = default_embedder()
+    start = time.perf_counter()
+    for _ in range(20):
+        embedder.encode(["things to see in Karachi"])
+    embed_ms = (time.perf_counter() - start) * 1000 / 20
+    print(f"{type(index).__name__} with {entries} entries: built in {build_s:.1f} s (background), "
+          f"{per_query:.2f} ms/lookup, {per_removal:.3f} ms/eviction")
+    print(f"{type(embedder).__name__}: {embed_ms:.2f} ms/question")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+# Single-flight call coalescing: concurrent callers with the same key share one
+# execution of the underlying function, and all of them get its result (or its
+# exception). Nothing is cached once the call finishes; the next caller starts
+# a fresh flight.
+
+
+class _Flight:
+    def __init__(self, state):
+        self.done = threading.Event()
+        self.state = state
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0        # upstream executions
+        self.coalesced = 0    # callers that joined an in-flight call instead
+        self.retried = 0      # followers that restarted a call their leader gave up on
+
+    def do(self, key, fn, timeout=None, state=None, on_join=None, retry_on=None):
+        """Run fn() once for all concurrent callers of key and return its result.
+
+        A follower that gives up after timeout gets TimeoutError; the shared call
+        keeps running for everyone else. If the leader's call raises anything,
+        including KeyboardInterrupt or a cancellation, every follower gets that
+        error and the key is released so the next caller retries, unless
+        retry_on(error) is true: then the error was the leader's own (its budget
+        ran out, it was interrupted) and the followers start a new flight.
+
+        The leader's state is kept with the flight; a follower's on_join, if
+        given, is called with it before waiting (e.g. to raise the priority).
+        """
+        expires = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight(state)
+                    self.calls += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                try:
+                    flight.result = fn()
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+                return flight.result
+
+            if on_join is not None:
+                on_join(flight.state)
+            left = None if expires is None else max(0.0, expires - time.monotonic())
+            if not flight.done.wait(left):
+                raise TimeoutError(f"timed out waiting for in-flight call {key!r}")
+            if flight.error is None:
+                return flight.result
+            if retry_on is None or not retry_on(flight.error):
+                raise flight.error
+            with self._lock:
+                self.retried += 1
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "retried": self.retried,
+                    "in_flight": len(self._flights)}
@@ -0,0 +1,229 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-ins for every external service the travel apps talk to.
+# Each one sleeps for a configurable latency instead of going over the network,
+# so load tests and benchmarks measure our code, not wttr.in or Gemini.
+
+# --- Latency ---
+class Latency:
+    def __init__(self, geocode=0.05, weather=0.15, flights=0.2, ip=0.05, llm=1.0, jitter=0.2):
+        self.seconds = {"geocode": geocode, "weather": weather, "flights": flights, "ip": ip, "llm": llm}
+        self.jitter = jitter
+
+    def sleep(self, service: str):
+        base = self.seconds.get(service, 0.0)
+        if base > 0:
+            time.sleep(base * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+CITIES = {
+    "paris": (48.8566, 2.3522), "london": (51.5074, -0.1278), "tokyo": (35.6762, 139.6503),
+    "miami": (25.7617, -80.1918), "dubai": (25.2048, 55.2708), "karachi": (24.8607, 67.0011),
+    "new york": (40.7128, -74.0060), "lahore": (31.5204, 74.3587),
+}
+
+# --- HTTP (requests.get) ---
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+def fake_http_get(latency: Latency):
+    def get(url, *args, **kwargs):
+        parsed = urlparse(url)
+        if "ip-api.com" in parsed.netloc:
+            latency.sleep("ip")
+            return FakeResponse({"status": "success", "city": "Paris"})
+        if "wttr.in" in parsed.netloc:
+            latency.sleep("weather")
+            return FakeResponse({"current_condition": [{
+                "temp_C": "21", "FeelsLikeC": "20", "humidity": "55", "windspeedKmph": "12",
+                "weatherDesc": [{"value": "Partly cloudy"}],
+            }]})
+        if "aviationstack.com" in parsed.netloc:
+            latency.sleep("flights")
+            iata = parse_qs(parsed.query).get("flight_iata", [""])[0].upper()
+            return FakeResponse({"data": [{
+                "airline": {"name": "Emirates"}, "flight_status": "scheduled",
+                "departure": {"airport": "Dubai International", "scheduled": "2025-08-10T08:00:00+00:00"},
+                "arrival": {"airport": "Heathrow", "scheduled": "2025-08-10T12:30:00+00:00"},
+                "flight": {"iata": iata},
+            }]})
+        return FakeResponse({}, status_code=404)
+    return get
+
+# --- Geocoding (Nominatim.geocode) ---
+class FakeLocation:
+    def __init__(self, address, latitude, longitude):
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+def fake_geocode(latency: Latency):
+    def geocode(self, query, *args, **kwargs):
+        latency.sleep("geocode")
+        coords = CITIES.get(str(query).strip().lower())
+        return FakeLocation(query, *coords) if coords else None
+    return geocode
+
+# --- Gemini (GenerativeModel.generate_content) ---
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def fake_generate_content(latency: Latency, calls: list):
+    def generate_content(self, contents, *args, **kwargs):
+        calls.append(contents)
+        latency.sleep("llm")
+        return FakeGeminiResponse(
+            '{"destination": "Paris", "duration_days": 3, "budget": 1500, '
+            '"activities": ["Louvre", "Seine cruise"], "notes": "Stand-in answer."}'
+        )
+    return generate_content
+
+# --- Install ---
+@contextmanager
+def installed(latency: Latency = None):
+    """Patch requests, geopy and google.generativeai with the stand-ins.
+
+    The semantic cache, the request log and the shared LLM quota are pointed at
+    a scratch directory, so a run neither reuses answers from the last one nor
+    touches what the production app reads. Yields the list of contents sent to the fake model,
+    so callers can count LLM calls.
+    """
+    latency = latency or Latency()
+    calls = []
+    with ExitStack() as stack:
+        scratch = stack.enter_context(tempfile.TemporaryDirectory(prefix="hj-standins-"))
+        stack.enter_context(mock.patch.dict(os.environ, {
+            "HJ_SEMANTIC_DIR": os.path.join(scratch, "semantic_cache"),
+            "HJ_REQUEST_LOG": os.path.join(scratch, "request_log.jsonl"),
+            "HJ_LLM_QUOTA_DB": os.path.join(scratch, "llm_quota.sqlite"),
+        }))
+        stack.enter_context(mock.patch("requests.get", fake_http_get(latency)))
+        stack.enter_context(mock.patch("geopy.geocoders.Nominatim.geocode", fake_geocode(latency)))
+        stack.enter_context(mock.patch("google.generativeai.GenerativeModel.generate_content",
+                                       fake_generate_content(latency, calls)))
+        stack.enter_context(mock.patch("google.generativeai.configure", lambda *a, **k: None))
+        yield calls
+
+# --- Quota-enforcing Gemini backend ---
+class FakeRateLimitError(Exception):
+    code = 429
+
+
+class FakeUsage:
+    def __init__(self, total_token_count):
+        self.total_token_count = total_token_count
+
+
+class FakeQuotaModel:
+    """A GenerativeModel look-alike that answers 429 once a 60 s window exceeds rpm or tpm.
+
+    Each call takes latency seconds, or a uniform draw up to max_latency if given
+    (real answer times vary with their length regardless of load).
+    """
+
+    model_name = "fake-quota-model"
+
+    def __init__(self, rpm=60, tpm=250_000, latency=0.5, output_tokens=200, max_latency=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency
+        self.max_latency = max_latency
+        self.output_tokens = output_tokens
+        self.served = 0
+        self.rejected = 0
+        self._window = deque()  # (timestamp, tokens)
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, *args, **kwargs):
+        tokens = len(str(contents)) // 4 + self.output_tokens
+        with self._lock:
+            now = time.monotonic()
+            while self._window and self._window[0][0] <= now - 60:
+                self._window.popleft()
+            if len(self._window) + 1 > self.rpm or sum(t for _, t in self._window) + tokens > self.tpm:
+                self.rejected += 1
+                raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+            self._window.append((now, tokens))
+            self.served += 1
+        time.sleep(random.uniform(self.latency, self.max_latency) if self.max_latency else self.latency)
+        response = FakeGeminiResponse("Stand-in answer.")
+        response.usage_metadata = FakeUsage(tokens)
+        return response
+
+    def stats(self) -> dict:
+        return {"served": self.served, "rejected": self.rejected}
+
+# --- Stalling HTTP server ---
+class _Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 overflows once hedges double the
+    # concurrency, and a dropped SYN is retried after ~1 s, which is
+    # indistinguishable from a stall in the latency numbers.
+    request_queue_size = 128
+
+
+class StallServer:
+    """Local JSON server that answers after latency seconds, but stalls for stall
+    seconds on stall_rate of requests and returns 500 on fail_rate of them."""
+
+    def __init__(self, latency=0.02, stall=2.0, stall_rate=0.05, fail_rate=0.0, payload=None):
+        self.latency = latency
+        self.stall = stall
+        self.stall_rate = stall_rate
+        self.fail_rate = fail_rate
+        self.payload = json.dumps(payload or {"ok": True}).encode("utf-8")
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                roll = random.random()
+                time.sleep(server.stall if roll < server.stall_rate else server.latency)
+                failed = random.random() < server.fail_rate
+                body = b'{"error": "injected"}' if failed else server.payload
+                self.send_response(500 if failed else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # client gave up on a stalled request
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = _Server(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
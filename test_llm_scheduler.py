@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_scheduler
+import resilience
+import standins
+
+
+def _scheduler(**kwargs):
+    return llm_scheduler.LLMScheduler(quota=llm_scheduler.LocalQuota(6000, 1e9), **kwargs)
+
+
+def test_varying_latency_does_not_shrink_the_limit():
+    # Latency that depends on answer length, not load, must not look like overload.
+    rng = random.Random(1)
+    scheduler = _scheduler(max_concurrency=8)
+    for _ in range(2000):
+        scheduler._observe(rng.uniform(0.5, 3.0))
+    assert scheduler.limit == 8
+
+    mixed = _scheduler(max_concurrency=8)
+    for _ in range(2000):
+        mixed._observe(rng.uniform(0.5, 1.5) if rng.random() < 0.8 else rng.uniform(5.0, 15.0))
+    assert mixed.limit == 8
+
+
+def test_rising_latency_shrinks_the_limit():
+    rng = random.Random(2)
+    scheduler = _scheduler(max_concurrency=8)
+    for _ in range(300):
+        scheduler._observe(rng.uniform(0.5, 3.0))
+    for _ in range(100):
+        scheduler._observe(4 * rng.uniform(0.5, 3.0))
+    assert scheduler.limit < 6
+
+
+def test_mixed_load_at_quota_gets_no_429s():
+    # The backend rejects anything past 14 calls in its 60 s window; the
+    # scheduler admits 4/s plus a burst of ~2, so ~12 calls fit in 2.5 s.
+    backend = standins.FakeQuotaModel(rpm=14, tpm=1e9, latency=0.01)
+    scheduler = llm_scheduler.LLMScheduler(rpm=240, tpm=1e9, burst=0.01, max_concurrency=4)
+
+    def call(i):
+        priority = llm_scheduler.INTERACTIVE if i % 3 == 0 else llm_scheduler.BATCH
+        try:
+            scheduler.run(lambda: backend.generate_content(f"call {i}"), priority, 100, timeout=2.5)
+        except resilience.DeadlineExceeded:
+            pass
+
+    with ThreadPoolExecutor(max_workers=30) as pool:
+        list(pool.map(call, range(30)))
+    assert backend.rejected == 0
+    assert scheduler.counts["rate_limited"] == 0
+    assert backend.served >= 8
+    assert scheduler.counts["interactive"] and scheduler.counts["batch"]
+
+
+def test_interactive_is_admitted_ahead_of_queued_batch():
+    scheduler = _scheduler(max_concurrency=1)
+    release = threading.Event()
+    order = []
+    blocker = threading.Thread(target=scheduler.run, args=(release.wait,))
+    blocker.start()
+    _wait_for(lambda: scheduler.stats()["active"] == 1)
+
+    threads = []
+    for name, priority in [("batch-1", llm_scheduler.BATCH), ("batch-2", llm_scheduler.BATCH),
+                           ("chat", llm_scheduler.INTERACTIVE)]:
+        t = threading.Thread(target=scheduler.run, args=(lambda name=name: order.append(name), priority))
+        t.start()
+        threads.append(t)
+        _wait_for(lambda n=len(threads): scheduler.stats()["queued"] == n)
+
+    release.set()
+    for t in [blocker] + threads:
+        t.join(5)
+    assert order == ["chat", "batch-1", "batch-2"]
+
+
+def test_rate_limit_backs_off_with_jitter_and_halves_the_limit():
+    delays = []
+    for _ in range(8):
+        scheduler = _scheduler(max_concurrency=8, backoff_base=0.1)
+        calls = []
+
+        def fn():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise standins.FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+            return "ok"
+
+        assert scheduler.run(fn) == "ok"
+        assert scheduler.limit == 4
+        assert scheduler.counts["rate_limited"] == 1 and scheduler.counts["retries"] == 1
+        delays.append(calls[1] - calls[0])
+    assert all(d <= 0.1 + 0.05 for d in delays)
+    assert len({round(d, 3) for d in delays}) > 1
+
+
+def test_shared_quota_is_not_over_admitted_by_two_instances(tmp_path):
+    # 60 rpm with a 10% burst: 6 at once, then one a second, across both.
+    path = str(tmp_path / "quota.sqlite")
+    quotas = [llm_scheduler.SharedQuota(path, rpm=60, tpm=1e9), llm_scheduler.SharedQuota(path, rpm=60, tpm=1e9)]
+    admitted = []
+    start = time.monotonic()
+
+    def hammer(quota):
+        while time.monotonic() - start < 1.5:
+            if quota.acquire(1) == 0:
+                admitted.append(1)
+            else:
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=hammer, args=(q,)) for q in quotas for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    # Two separate buckets would admit 6 + 1.5 each.
+    assert 6 <= len(admitted) <= 6 + elapsed + 1
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import resilience
+from standins import StallServer
+
+
+def _fetch(server):
+    def fetch(timeout):
+        res = requests.get(server.url, timeout=timeout)
+        res.raise_for_status()
+        return res.json()
+    return fetch
+
+
+def test_hedging_keeps_p99_below_the_stall():
+    with StallServer(latency=0.02, stall=2.0, stall_rate=0.03) as server:
+        upstream = resilience.Upstream("test-hedged", max_timeout=5.0)
+        fetch = _fetch(server)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            # Warm up until hedging is active, then measure from a clean tracker.
+            list(pool.map(lambda _: upstream.call(fetch), range(50)))
+            upstream.served = resilience.LatencyTracker(window=1000)
+            # A hedge can stall too (3% of 3%), so ~0.1-0.2% of calls still wait
+            # out the stall. 1000 calls keep that well clear of the top 1%.
+            list(pool.map(lambda _: upstream.call(fetch), range(1000)))
+
+    report = upstream.report()
+    assert report["hedged"] > 0
+    assert report["hedged"] <= 0.1 * report["calls"] + 1
+    assert upstream.served.percentile(99) < server.stall / 2
+
+
+def test_open_breaker_serves_the_last_good_value():
+    with StallServer(latency=0.0, stall_rate=0.0) as server:
+        upstream = resilience.Upstream("test-breaker", max_timeout=2.0, hedge=False,
+                                       failure_threshold=2, reset_after=60.0)
+        fetch = _fetch(server)
+        assert upstream.call(fetch, key="k") == {"ok": True}
+
+        server.fail_rate = 1.0
+        for _ in range(2):
+            assert upstream.call(fetch, key="k") == {"ok": True}
+        assert upstream.breaker.state == "open"
+
+        requests_before = server.requests
+        assert upstream.call(fetch, key="k") == {"ok": True}
+        assert server.requests == requests_before
+        assert upstream.counts["short_circuited"] == 1
+        assert upstream.counts["stale_served"] == 3
+
+        try:
+            upstream.call(fetch, key="other")
+        except resilience.CircuitOpen:
+            pass
+        else:
+            raise AssertionError("expected CircuitOpen without a stale value")
+
+
+def test_unhedged_calls_run_on_the_callers_thread():
+    upstream = resilience.Upstream("test-inline", max_timeout=1.0, hedge=False)
+    assert upstream.call(lambda timeout: threading.current_thread()) is threading.current_thread()
+
+
+def test_a_stalled_upstream_does_not_delay_another():
+    release = threading.Event()
+    stalled = resilience.Upstream("test-stalled", max_timeout=5.0, pool_size=4, failure_threshold=1)
+    healthy = resilience.Upstream("test-healthy", max_timeout=0.5, failure_threshold=1)
+    with ThreadPoolExecutor(max_workers=8) as callers:
+        stuck = [callers.submit(stalled.call, lambda timeout: release.wait(timeout)) for _ in range(8)]
+        time.sleep(0.05)
+        start = time.monotonic()
+        assert healthy.call(lambda timeout: "ok") == "ok"
+        assert time.monotonic() - start < 0.1
+        assert healthy.breaker.state == "closed"
+        release.set()
+        for f in stuck:
+            f.result()
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+import semantic_cache
+from semantic_cache import HashingEmbedder, SemanticCache
+
+
+@pytest.fixture
+def open_cache(tmp_path):
+    caches = []
+
+    def open_cache(**kwargs):
+        kwargs.setdefault("threshold", 0.8)
+        cache = SemanticCache(str(tmp_path), embedder=HashingEmbedder(), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield open_cache
+    for cache in caches:
+        if not cache._closed:
+            cache.close()
+
+
+def test_hit_above_the_threshold_and_miss_below_it(open_cache):
+    cache = open_cache()
+    cache.add("Plan 5 days in Paris", "Day 1: Louvre")
+    assert cache.lookup("plan 5 days in paris?") == "Day 1: Louvre"          # same words: ~1.0
+    assert cache.lookup("Plan 5 days in Paris please") == "Day 1: Louvre"    # ~0.89
+    assert cache.lookup("Cheap food in Tokyo") is None
+
+    strict = open_cache(threshold=0.95)
+    assert strict.lookup("Plan 5 days in Paris please") is None
+    assert strict.lookup("Plan 5 days in Paris") == "Day 1: Louvre"
+
+
+def test_different_numbers_never_match(open_cache):
+    cache = open_cache(threshold=0.5)
+    cache.add("Plan 5 days in Paris", "five days")
+    assert cache.lookup("Plan 3 days in Paris") is None    # ~0.90 similar, but 3 != 5
+    assert cache.lookup("Plan 5 days in Paris") == "five days"
+
+
+def test_scopes_do_not_share_answers(open_cache):
+    cache = open_cache()
+    cache.add("Best time to visit Tokyo?", "Spring", scope="English")
+    cache.add("Best time to visit Tokyo?", "بہار", scope="اردو")
+    assert cache.lookup("Best time to visit Tokyo?", scope="English") == "Spring"
+    assert cache.lookup("Best time to visit Tokyo?", scope="اردو") == "بہار"
+    assert cache.lookup("Best time to visit Tokyo?", scope="العربية") is None
+
+
+def test_least_recently_hit_entry_is_evicted(open_cache):
+    cache = open_cache(max_entries=2)
+    cache.add("Cheap food in Paris", "crepes")
+    time.sleep(0.01)
+    cache.add("Cheap food in Tokyo", "ramen")
+    time.sleep(0.01)
+    assert cache.lookup("Cheap food in Paris") == "crepes"
+    time.sleep(0.01)
+    cache.add("Cheap food in Rome", "pizza")
+    assert cache.lookup("Cheap food in Tokyo") is None
+    assert cache.lookup("Cheap food in Paris") == "crepes"
+    assert cache.lookup("Cheap food in Rome") == "pizza"
+    assert cache.stats()["entries"] == 2
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_ignored_then_swept(open_cache):
+    cache = open_cache(ttl=0.05, sweep_interval=0)
+    cache.add("Cheap food in Paris", "crepes")
+    time.sleep(0.1)
+    assert cache.lookup("Cheap food in Paris") is None
+    cache.add("Cheap food in Tokyo", "ramen")
+    assert cache.stats()["entries"] == 1
+    assert cache.evictions == 1
+
+
+def test_saved_index_is_reloaded_with_later_rows(open_cache):
+    cache = open_cache()
+    cache.add("Plan 5 days in Paris", "Day 1: Louvre")
+    cache.save()
+    cache.add("Cheap food in Tokyo", "ramen")    # after the save: replayed from SQLite
+    cache._dirty = False                         # close() without saving again
+    cache.close()
+
+    reopened = open_cache()
+    assert reopened.lookup("Plan 5 days in Paris") == "Day 1: Louvre"
+    assert reopened.lookup("Cheap food in Tokyo") == "ramen"
+
+
+def test_changes_during_a_save_are_applied_after_it(open_cache, monkeypatch):
+    cache = open_cache()
+    cache.add("Plan 5 days in Paris", "Day 1: Louvre")
+    write = semantic_cache._save_index
+    seen = {}
+
+    def slow_write(index, path, meta):
+        # Runs while the index is being written: lookups still work, the add is held back.
+        seen["lookup"] = cache.lookup("Plan 5 days in Paris")
+        cache.add("Cheap food in Tokyo", "ramen")
+        seen["new"] = cache.lookup("Cheap food in Tokyo")
+        write(index, path, meta)
+
+    monkeypatch.setattr(semantic_cache, "_save_index", slow_write)
+    cache.save()
+    assert seen == {"lookup": "Day 1: Louvre", "new": None}
+    assert cache.lookup("Cheap food in Tokyo") == "ramen"
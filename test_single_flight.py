@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import llm
+import llm_scheduler
+import resilience
+from single_flight import SingleFlight
+
+
+class _Model:
+    """Records each prompt it is sent."""
+
+    model_name = "recording-model"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.prompts = []
+
+    def generate_content(self, contents, **kwargs):
+        self.prompts.append(contents)
+        time.sleep(self.latency)
+        return f"answer to {contents}"
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = llm_scheduler.LLMScheduler(quota=llm_scheduler.LocalQuota(6000, 1e9), max_concurrency=1)
+    monkeypatch.setattr(llm, "scheduler", scheduler)
+    monkeypatch.setattr(llm, "flights", SingleFlight())
+    return scheduler
+
+
+def _start(target, *args):
+    t = threading.Thread(target=target, args=args)
+    t.start()
+    return t
+
+
+def test_follower_retries_when_the_leader_runs_out_of_its_own_budget():
+    flights = SingleFlight()
+    calls = []
+    results = {}
+
+    def leader():
+        def fn():
+            calls.append("leader")
+            time.sleep(0.1)
+            raise resilience.DeadlineExceeded("leader's budget ran out")
+        try:
+            flights.do("k", fn, retry_on=lambda e: isinstance(e, resilience.DeadlineExceeded))
+        except resilience.DeadlineExceeded as e:
+            results["leader"] = e
+
+    def follower():
+        def fn():
+            calls.append("follower")
+            return "answer"
+        results["follower"] = flights.do("k", fn, timeout=5,
+                                         retry_on=lambda e: isinstance(e, resilience.DeadlineExceeded))
+
+    a = _start(leader)
+    time.sleep(0.02)
+    b = _start(follower)
+    a.join()
+    b.join()
+    assert isinstance(results["leader"], resilience.DeadlineExceeded)
+    assert results["follower"] == "answer"
+    assert calls == ["leader", "follower"]
+    assert flights.stats()["retried"] == 1
+
+
+def test_identical_prompts_reach_the_model_once(scheduler):
+    model = _Model(latency=0.2)
+    start = threading.Barrier(10)
+
+    def ask(_):
+        start.wait()
+        return llm.generate_content(model, "Plan 3 days in  Paris")
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        answers = list(pool.map(ask, range(10)))
+    assert model.prompts == ["Plan 3 days in  Paris"]
+    assert answers == ["answer to Plan 3 days in  Paris"] * 10
+    assert llm.flights.stats() == {"calls": 1, "coalesced": 9, "retried": 0, "in_flight": 0}
+
+
+def test_follower_timeout_leaves_the_flight_running():
+    flights = SingleFlight()
+    release = threading.Event()
+    results = {}
+    leader = _start(lambda: results.setdefault("leader", flights.do("k", lambda: release.wait() and "answer")))
+    _wait_for(lambda: flights.in_flight() == 1)
+
+    with pytest.raises(TimeoutError):
+        flights.do("k", lambda: "second call", timeout=0.05)
+    assert flights.in_flight() == 1
+
+    release.set()
+    leader.join(5)
+    assert results["leader"] == "answer"
+    assert flights.stats()["calls"] == 1
+
+
+def test_leader_exception_reaches_followers_and_releases_the_key():
+    flights = SingleFlight()
+    error = ValueError("upstream said no")
+    caught = []
+
+    def fail():
+        time.sleep(0.1)
+        raise error
+
+    def call():
+        try:
+            flights.do("k", fail, timeout=5)
+        except ValueError as e:
+            caught.append(e)
+
+    threads = [_start(call) for _ in range(5)]
+    for t in threads:
+        t.join(5)
+    assert caught == [error] * 5
+    assert flights.stats()["calls"] == 1
+    assert flights.in_flight() == 0
+    assert flights.do("k", lambda: "fresh") == "fresh"
+
+
+def test_interactive_follower_moves_a_batch_leader_ahead_of_other_batch(scheduler):
+    model = _Model()
+    release = threading.Event()
+    blocker = _start(lambda: scheduler.run(release.wait))
+    _wait_for(lambda: scheduler.stats()["active"] == 1)
+
+    other = _start(lambda: scheduler.run(lambda: model.generate_content("other batch job"), llm.BATCH))
+    _wait_for(lambda: scheduler.stats()["queued"] == 1)
+    batch = _start(lambda: llm.generate_content(model, "plan for Tokyo", priority=llm.BATCH))
+    _wait_for(lambda: scheduler.stats()["queued"] == 2)
+    answers = []
+    chat = _start(lambda: answers.append(llm.generate_content(model, "plan for Tokyo", priority=llm.INTERACTIVE)))
+    _wait_for(lambda: scheduler.counts["promoted"] == 1)
+
+    release.set()
+    for t in (blocker, other, batch, chat):
+        t.join(5)
+    assert model.prompts == ["plan for Tokyo", "other batch job"]
+    assert answers == ["answer to plan for Tokyo"]
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
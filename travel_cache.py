@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Process-wide TTL cache shared by every Streamlit session and the prefetcher.
+# Entries remember who loaded them, so we can count how many user requests
+# were served warm because the prefetcher got there first.
+
+USER = "user"
+PREFETCH = "prefetch"
+
+# The prefetcher only reloads entries that expire within this many seconds;
+# it sets this to a little more than its interval, so each entry is reloaded
+# about once per TTL rather than on every round.
+REFRESH_MARGIN = 0.0
+
+
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # key -> (expires_at, value, source, saved_until). saved_until is when the
+        # entry a prefetch replaced would have expired; user hits before then
+        # would have been warm without the prefetcher.
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_saves = 0
+        self.refreshes = 0
+
+    def get(self, key, source=USER):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                return None
+            self._data.move_to_end(key)
+            if source == USER:
+                self.hits += 1
+                if entry[2] == PREFETCH:
+                    # Only the first user hit was saved from the cold path, and only
+                    # if the entry the prefetcher replaced would have been gone by now.
+                    if now >= entry[3]:
+                        self.prefetch_saves += 1
+                    self._data[key] = (entry[0], entry[1], USER, 0.0)
+            return entry[1]
+
+    def put(self, key, value, source=USER):
+        with self._lock:
+            old = self._data.get(key)
+            saved_until = old[0] if old is not None and source == PREFETCH else 0.0
+            self._data[key] = (time.monotonic() + self.ttl, value, source, saved_until)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader, source=USER):
+        """Return the cached value for key, calling loader() on a miss.
+
+        Loader exceptions propagate and nothing is cached. None results are not cached either.
+        """
+        value = self.get(key, source)
+        if value is not None:
+            return value
+        if source == USER:
+            with self._lock:
+                self.misses += 1
+        value = loader()
+        if value is not None:
+            self.put(key, value, source)
+        return value
+
+    def refresh(self, key, loader):
+        """Reload key on behalf of the prefetcher if it is missing or expires within REFRESH_MARGIN."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is not None and entry[0] - time.monotonic() > REFRESH_MARGIN:
+            return entry[1]
+        value = loader()
+        if value is not None:
+            self.put(key, value, PREFETCH)
+            with self._lock:
+                self.refreshes += 1
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                    "prefetch_saves": self.prefetch_saves, "refreshes": self.refreshes}
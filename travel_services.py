@@ -0,0 +1,162 @@
+import os
+import threading
+import requests
+from geopy.geocoders import Nominatim
+import google.generativeai as genai
+
+import llm
+import map_render
+import resilience
+import semantic_cache
+from travel_cache import TTLCache, USER, PREFETCH
+
+# External lookups used by v6_streamlit_agent.py, cached per process so that
+# every session (and the background prefetcher) shares the same results.
+
+MODEL_NAME = "gemini-2.5-flash"
+# No trip length: the semantic cache only matches questions with the same
+# numbers, and a prefetched plan should answer "plan a trip to X" style questions.
+PLAN_PROMPT = "Plan a trip to {city} with the top sights, food and local tips."
+SEMANTIC_CACHE = os.getenv("HJ_SEMANTIC_CACHE", "1") == "1"
+
+model = genai.GenerativeModel(MODEL_NAME)
+geo = Nominatim(user_agent="travel-app")
+
+ip_api = resilience.upstream("ip-api", max_timeout=2.0)
+nominatim = resilience.upstream("nominatim", max_timeout=5.0)
+wttr = resilience.upstream("wttr.in", max_timeout=5.0)
+aviationstack = resilience.upstream("aviationstack", max_timeout=5.0)
+
+geocode_cache = TTLCache(ttl=7 * 24 * 3600)
+weather_cache = TTLCache(ttl=30 * 60)
+plan_cache = TTLCache(ttl=6 * 3600, maxsize=256)
+CACHES = {"geocode": geocode_cache, "weather": weather_cache, "map": map_render.cache, "plan": plan_cache}
+
+# --- Live traffic ---
+_live = 0
+_live_lock = threading.Lock()
+
+
+def live_inflight() -> int:
+    """Number of user requests currently waiting on an upstream call."""
+    return _live
+
+
+def _cold(loader):
+    def run():
+        global _live
+        with _live_lock:
+            _live += 1
+        try:
+            return loader()
+        finally:
+            with _live_lock:
+                _live -= 1
+    return run
+
+
+def _load(cache, key, loader, source):
+    if source == PREFETCH:
+        return cache.refresh(key, loader)
+    return cache.get_or_load(key, _cold(loader))
+
+# --- Lookups ---
+def detect_city(default="Paris") -> str:
+    try:
+        return ip_api.call(lambda t: requests.get("http://ip-api.com/json/", timeout=t).json().get("city", default), key="city")
+    except Exception:
+        return default
+
+
+def geocode(destination: str, source=USER):
+    """Return (latitude, longitude) for destination, or None if it cannot be found."""
+    def fetch(timeout):
+        loc = geo.geocode(destination, timeout=timeout)
+        return (loc.latitude, loc.longitude) if loc else None
+
+    def load():
+        return nominatim.call(fetch, key=destination.strip().lower())
+    return _load(geocode_cache, destination.strip().lower(), load, source)
+
+
+def current_weather(destination: str, source=USER) -> dict:
+    """Return wttr.in's current_condition block for destination. Raises if unavailable."""
+    def fetch(timeout):
+        return requests.get(f"https://wttr.in/{destination.replace(' ', '+')}?format=j1", timeout=timeout).json()["current_condition"][0]
+
+    def load():
+        return wttr.call(fetch, key=destination.strip().lower())
+    return _load(weather_cache, destination.strip().lower(), load, source)
+
+
+def flight_info(iata: str, access_key: str):
+    """Return aviationstack's first record for the flight, or None if it is unknown."""
+    def fetch(timeout):
+        res = requests.get(f"http://api.aviationstack.com/v1/flights?access_key={access_key}&flight_iata={iata}",
+                           timeout=timeout).json()
+        return res["data"][0] if res.get("data") else None
+    return aviationstack.call(fetch, key=iata.strip().upper())
+
+
+def map_html(lat: float, lon: float, label: str, source=USER) -> str:
+    return map_render.render(lat, lon, 10, [(lat, lon, label)], source)
+
+
+def _prompt_key(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def start_semantic_cache():
+    if SEMANTIC_CACHE:
+        semantic_cache.start()
+
+
+def _semantic(method, *args):
+    # The semantic cache is an optimisation: until it has loaded, or if it
+    # failed to, or if it errors, every lookup is a miss.
+    cache = semantic_cache.get_default()
+    if cache is None:
+        return None
+    try:
+        return getattr(cache, method)(*args)
+    except Exception:
+        return None
+
+
+def ask(messages: list, source=USER, scope="English") -> str:
+    """Send the chat's user messages to Gemini.
+
+    Single-question conversations are cached, exactly and by meaning within
+    scope (the selected language), so a plan the prefetcher already generated
+    or a paraphrase of an earlier question is served without another model call.
+    """
+    def generate():
+        priority = llm.BATCH if source == PREFETCH else llm.INTERACTIVE
+        return llm.generate_content(model, messages, priority).text
+    if len(messages) != 1:
+        return generate()
+
+    question = messages[0]["parts"]
+
+    def load():
+        # Prefetched answers always come from the model and go into the
+        # semantic cache, which is how they reach users' own wording.
+        answer = _semantic("lookup", question, scope) if source == USER else None
+        if answer is None:
+            answer = generate()
+            _semantic("add", question, answer, scope)
+        return answer
+    return _load(plan_cache, (scope, _prompt_key(question)), load, source)
+
+
+def plan(city: str, source=USER) -> str:
+    return ask([{"role": "user", "parts": PLAN_PROMPT.format(city=city)}], source)
+
+
+def semantic_stats() -> dict:
+    cache = semantic_cache.get_default()
+    return cache.stats() if cache is not None else semantic_cache.status()
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -3,6 +3,7 @@ from typing import List
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import google.generativeai as genai
+import llm
 import os
 
 # Load environment variables
@@ -43,10 +44,10 @@ Respond in the following JSON format:
     # Use the Gemini model
     model = genai.GenerativeModel("gemini-pro")
 
-    response = model.generate_content([
+    response = await llm.generate_content_async(model, [
         {"role": "system", "parts": [system_prompt]},
         {"role": "user", "parts": [query]}
-    ])
+    ], priority=llm.BATCH)
 
     try:
         content = response.text.strip()
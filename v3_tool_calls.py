@@ -4,6 +4,7 @@ from typing import List
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import google.generativeai as genai
+import llm
 
 # Load environment variables
 load_dotenv()
@@ -70,7 +71,7 @@ User query: {query}
 """
 
     model = genai.GenerativeModel("gemini-pro")
-    response = model.generate_content(system_prompt)
+    response = await llm.generate_content_async(model, system_prompt, priority=llm.BATCH)
 
     try:
         content = response.text.strip()
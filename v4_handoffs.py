@@ -4,6 +4,7 @@ from typing import List, Optional
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import google.generativeai as genai
+import llm
 
 # Load environment variables
 load_dotenv()
@@ -113,7 +114,7 @@ def build_travel_prompt(destination: str, days: int, budget: float) -> str:
 def generate_travel_plan(destination: str, days: int, budget: float) -> TravelPlan:
     prompt = build_travel_prompt(destination, days, budget)
     model = genai.GenerativeModel("gemini-1.5-pro")  # Updated model name
-    response = model.generate_content(prompt)
+    response = llm.generate_content(model, prompt, priority=llm.BATCH)
 
     try:
         raw = response.text
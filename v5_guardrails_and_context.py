@@ -5,6 +5,7 @@ from typing import List, Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 import google.generativeai as genai
+import llm
 
 # Load API key from .env
 load_dotenv()
@@ -104,7 +105,7 @@ def build_travel_prompt(destination: str, days: int, budget: float) -> str:
 def generate_travel_plan(destination: str, days: int, budget: float) -> TravelPlan:
     model = genai.GenerativeModel("gemini-1.5-pro")
     prompt = build_travel_prompt(destination, days, budget)
-    response = model.generate_content(prompt)
+    response = llm.generate_content(model, prompt, priority=llm.BATCH)
     raw = response.text
     try:
         travel_json = raw[raw.find('{'):raw.rfind('}')+1]
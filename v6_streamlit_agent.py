@@ -1,22 +1,36 @@
 import streamlit as st
 import uuid
 import os
-import requests
 import pdfkit
-import folium
 from datetime import datetime
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from geopy.geocoders import Nominatim
 import google.generativeai as genai
+import llm
+import map_render
+import prefetch
+import resilience
+import travel_services
 
 # --- Setup ---
 st.set_page_config(page_title="✈️HJ Smart Travel Assistant", layout="wide")
+resilience.set_budget()
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 AVIATIONSTACK_KEY = os.getenv("AVIATIONSTACK_KEY", "5f427bc4eecf7a9f410f65bcfda6ab62")
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.5-flash")
+
+@st.cache_resource
+def start_prefetcher():
+    return prefetch.from_env().start()
+
+prefetcher = start_prefetcher()
+
+@st.cache_resource
+def start_semantic_cache():
+    travel_services.start_semantic_cache()
+
+start_semantic_cache()
 
 class UserContext(BaseModel):
     user_id: str
@@ -68,30 +82,32 @@ border-left:4px solid #4caf50; box-shadow:0 4px 10px rgba(0,0,0,0.1); word-break
 
 # --- Location Input ---
 st.sidebar.subheader("📍 Location")
-try:
-    city = requests.get("http://ip-api.com/json/").json().get("city", "Paris")
-except:
-    city = "Paris"
-
-destination = st.sidebar.text_input("Enter City", value=city)
+city = travel_services.detect_city()
+
+# Only cities the user types count towards prefetching; the detected default
+# would otherwise be logged once for every new session.
+destination = st.sidebar.text_input(
+    "Enter City", value=city, key="destination",
+    on_change=lambda: prefetch.record_request(st.session_state.destination),
+)
 flight = st.sidebar.text_input("✈️ Flight IATA (e.g., EK202)")
 
 st.title("🌐HJ Smart Travel Assistant")
 
-geo = Nominatim(user_agent="travel-app")
-loc = geo.geocode(destination)
+try:
+    loc = travel_services.geocode(destination)
+except Exception:
+    loc = None
 
 if loc:
     c1, c2 = st.columns(2)
     with c1:
-        m = folium.Map(location=[loc.latitude, loc.longitude], zoom_start=10)
-        folium.Marker([loc.latitude, loc.longitude], popup=destination).add_to(m)
-        st.components.v1.html(m._repr_html_(), height=300)
+        st.components.v1.html(travel_services.map_html(loc[0], loc[1], destination), height=300)
 
     with c2:
         st.subheader(lang["weather"])
         try:
-            r = requests.get(f"https://wttr.in/{destination.replace(' ', '+')}?format=j1").json()["current_condition"][0]
+            r = travel_services.current_weather(destination)
             st.markdown(f"""
             **Temperature**: {r['temp_C']}°C  
             **Feels Like**: {r['FeelsLikeC']}°C  
@@ -108,9 +124,8 @@ else:
 if flight:
     st.subheader(f"📡 Flight Info: {flight.upper()}")
     try:
-        res = requests.get(f"http://api.aviationstack.com/v1/flights?access_key={AVIATIONSTACK_KEY}&flight_iata={flight}").json()
-        if res.get("data"):
-            f = res["data"][0]
+        f = travel_services.flight_info(flight, AVIATIONSTACK_KEY)
+        if f:
             st.markdown(f"""
             **Airline**: {f['airline']['name']}  
             **{lang['from']}**: {f['departure']['airport']}  
@@ -131,7 +146,7 @@ if inp:
     with st.spinner("💡 Gemini thinking..."):
         try:
             msgs = [{"role": "user", "parts": m["content"]} for m in st.session_state.chat_history if m["role"] == "user"]
-            reply = model.generate_content(msgs).text
+            reply = travel_services.ask(msgs, scope=st.session_state.language)
         except Exception as e:
             reply = f"❌ Error: {e}"
         st.session_state.chat_history.append({"role": "assistant", "content": reply, "timestamp": datetime.now().strftime("%I:%M %p")})
@@ -156,6 +171,13 @@ if st.sidebar.button(lang["reset"]):
     st.session_state.chat_history = []
     st.success("✅ Reset done!")
 
+# --- Cache Metrics ---
+if os.getenv("HJ_DEBUG_METRICS") == "1":
+    with st.sidebar.expander("⚙️ Cache metrics"):
+        st.json(prefetcher.metrics())
+        st.json({"map": map_render.stats(), "llm": llm.stats(), "semantic": travel_services.semantic_stats()})
+        st.json({"upstreams": resilience.report()})
+
 # --- Footer ---
 st.markdown("<hr style='margin-top:2rem;'>", unsafe_allow_html=True)
 st.markdown(f"<div style='text-align:center;font-size:13px;'>🌐 Smart Assistant · BUILD BY HAMMAD AHMAD· {st.session_state.language} · © 2025</div>", unsafe_allow_html=True)